@@ -1,24 +1,68 @@
 #!/usr/bin/env python3
 
-import argparse
+import os
 import re
 import sys
-from collections import OrderedDict
-
-
-def detect_language(markdown_content):
-    """
-    Detects the language of the markdown content (German or English).
-    Uses simple heuristics based on common German and English words.
-
-    Args:
-        markdown_content (str): The markdown content to analyze
-
-    Returns:
-        str: 'de' for German, 'en' for English (defaults to 'de')
-    """
-    # German indicators
-    german_words = [
+from collections import Counter, OrderedDict
+
+# Precompiled patterns used by detect_language and preprocess_markdown
+
+# Footnote definitions - handles both single and multi-line footnotes
+_FOOTNOTE_RE = re.compile(r"\[(\^[\w-]+)\]:\s*(.+?)(?=\n\[|\n\n|\Z)", re.DOTALL)
+
+# Math expressions - \$ ... \$ or $ ... $ (or mixed)
+# Pattern explanation:
+# - (?:\\\$|\$) matches opening dollar (escaped or unescaped)
+# - \s* allows optional whitespace after opening dollar
+# - (.*?) captures content non-greedily (will stop at first closing dollar)
+# - \s* allows optional whitespace before closing dollar
+# - (?:\\\$|\$) matches closing dollar (escaped or unescaped)
+_MATH_RE = re.compile(r"(?:\\\$|\$)\s*(.*?)\s*(?:\\\$|\$)")
+
+# Centered divs (<div style="text-align: center"> and <div align="center">)
+# or existing \end{center}, followed by whitespace but not followed by ---
+_CENTER_RE = re.compile(
+    r'(?:<div (?:style="text-align: center"|align="center")>(.*?)</div>'
+    r"|\\end\{center\})\s*(?!\n\s*---)"
+)
+
+# Multiple consecutive empty lines, or runs of spaces and tabs other than a
+# single space; single spaces are left alone, so that they do not cost a
+# replacement callback each
+_CLEANUP_RE = re.compile(r"(\n\n\n+)|(?:\t[ \t]*| [ \t]+)")
+
+# Footnote definitions to be removed: [^ref]: content
+# Every "[^ref]:" occurrence is consumed, so this also covers standalone
+# reference lines (lines that start with [^...]:)
+_FOOTNOTE_REMOVAL_RE = re.compile(r"\[(\^[\w-]+)\]:\s*.*?(?=\n\[|\n\n|\Z)", re.DOTALL)
+
+# Runs of consecutive citations: [@ref1][@ref2][@ref3]
+# A failed attempt costs at most one citation, so the scan stays linear.
+_CONSEC_CITES_RE = re.compile(r"\[@\w+\](?:\[@\w+\])+")
+
+# Font fallback configuration added to the YAML front matter
+_FALLBACK_FONTS_YAML = """\
+  - "Noto Emoji:"
+  - "DejaVu Serif:"
+  - "FreeSerif:"
+"""
+_MAIN_FONT_FALLBACK_YAML = "\nmainfontfallback:\n" + _FALLBACK_FONTS_YAML
+_SANS_FONT_FALLBACK_YAML = "\nsansfontfallback:\n" + _FALLBACK_FONTS_YAML
+_MONO_FONT_FALLBACK_YAML = "\nmonofontfallback:\n" + _FALLBACK_FONTS_YAML
+
+# Words used for language detection
+_WORD_RE = re.compile(r"\b\w+\b")
+
+# Separator between documents in --batch mode: a line holding only the
+# sentinel, together with the line break ending the preceding document
+BATCH_SEPARATOR = "\n\x1e---ENDOFDOC---\x1e\n"
+
+# Number of characters sampled by detect_language
+_LANGUAGE_SAMPLE_SIZE = 64 * 1024
+
+# German indicators
+_GERMAN_WORDS = frozenset(
+    [
         "der",
         "die",
         "das",
@@ -60,7 +104,6 @@ def detect_language(markdown_content):
         "was",
         "wo",
         "warum",
-        "wenn",
         "dann",
         "aber",
         "oder",
@@ -70,9 +113,11 @@ def detect_language(markdown_content):
         "jedoch",
         "deshalb",
     ]
+)
 
-    # English indicators
-    english_words = [
+# English indicators
+_ENGLISH_WORDS = frozenset(
+    [
         "the",
         "and",
         "is",
@@ -95,7 +140,6 @@ def detect_language(markdown_content):
         "can",
         "had",
         "her",
-        "was",
         "one",
         "our",
         "out",
@@ -124,14 +168,114 @@ def detect_language(markdown_content):
         "too",
         "use",
     ]
+)
+
+
+def _replace_center(match):
+    """Replacement for _CENTER_RE: LaTeX centering followed by a horizontal line."""
+    if match.group(1) is not None:
+        return f"\\begin{{center}}\n{match.group(1)}\n\\end{{center}}\n\n---"
+    return "\\end{center}\n\n---"
+
+
+def _cleanup_whitespace(match):
+    """Replacement for _CLEANUP_RE: one empty line or a single space."""
+    return "\n\n" if match.group(1) else " "
+
+
+def _consolidate_citations(match):
+    """Replacement for _CONSEC_CITES_RE: [@ref1][@ref2] -> [@ref1; @ref2]."""
+    # A run consists of citations only, so a plain string replace is exact
+    return match.group(0).replace("][@", "; @")
+
 
-    # Convert to lowercase and split into words
-    content_lower = markdown_content.lower()
-    words = re.findall(r"\b\w+\b", content_lower)
+def _build_front_matter(yaml_content, unique_references, language, no_fallback_fonts):
+    """
+    Adds bibliography entries, citation style, language and PDF settings to YAML
+    front matter. Settings already present in the given YAML are kept as they are.
+
+    Args:
+        yaml_content (str): Existing YAML front matter without --- delimiters, or ""
+        unique_references (OrderedDict): Mapping of reference ids to URLs
+        language (str): Language code for citations (e.g., "de-DE", "en-US")
+        no_fallback_fonts (bool): If True, skip adding font fallback configuration
+
+    Returns:
+        str: The YAML front matter without --- delimiters
+    """
+    parts = [yaml_content]
+    if "references:" not in yaml_content:
+        parts.append("\nreferences:\n" if yaml_content else "references:\n")
+    for ref, content in unique_references.items():
+        parts.append(f"  - id: {ref}\n    type: webpage\n    URL: {content}\n")
+
+    # Add Nature citation style if not already present (clean numbered style)
+    if "csl:" not in yaml_content:
+        parts.append(
+            "\ncsl: https://raw.githubusercontent.com/citation-style-language/styles/master/nature.csl\n"
+        )
+
+    # Add language for citations if not already present
+    if "lang:" not in yaml_content:
+        parts.append(f"\nlang: {language}\n")
+
+    # Add link-citations option if not already present
+    if "link-citations:" not in yaml_content:
+        parts.append("\nlink-citations: true\n")
+
+    # Add PDF engine and font fallback configuration if not already present
+    if "pdf-engine:" not in yaml_content:
+        parts.append("\npdf-engine: lualatex\n")
+    if not no_fallback_fonts:
+        if "mainfontfallback:" not in yaml_content:
+            parts.append(_MAIN_FONT_FALLBACK_YAML)
+        if "sansfontfallback:" not in yaml_content:
+            parts.append(_SANS_FONT_FALLBACK_YAML)
+        if "monofontfallback:" not in yaml_content:
+            parts.append(_MONO_FONT_FALLBACK_YAML)
+
+    return "".join(parts)
+
+
+def split_front_matter(markdown_content):
+    """
+    Splits a document into its YAML front matter and the rest of the document.
+
+    Args:
+        markdown_content (str): The markdown content
+
+    Returns:
+        tuple: (yaml_content, document_content), where yaml_content is the YAML
+            front matter without --- delimiters, or None if the document does
+            not start with a complete front matter block
+    """
+    if markdown_content.startswith("---\n"):
+        yaml_end = markdown_content.find("\n---\n", 4)
+        if yaml_end != -1:
+            return markdown_content[4:yaml_end], markdown_content[yaml_end + 5 :]
+    return None, markdown_content
 
-    # Count German and English word occurrences
-    german_count = sum(1 for word in words if word in german_words)
-    english_count = sum(1 for word in words if word in english_words)
+
+def detect_language(markdown_content):
+    """
+    Detects the language of the markdown content (German or English).
+    Uses simple heuristics based on common German and English words.
+
+    Args:
+        markdown_content (str): The markdown content to analyze
+
+    Returns:
+        str: 'de' for German, 'en' for English (defaults to 'de')
+    """
+    # Only the beginning of the document is sampled; the language rarely
+    # changes mid-document and this bounds the cost for large inputs
+    content_lower = markdown_content[:_LANGUAGE_SAMPLE_SIZE].lower()
+
+    # Tally all words in a single pass (done in C by findall and Counter), then
+    # count German and English word occurrences by looking up the indicators
+    word_counts = Counter(_WORD_RE.findall(content_lower))
+    german_count = sum(word_counts[word] for word in _GERMAN_WORDS)
+    english_count = sum(word_counts[word] for word in _ENGLISH_WORDS)
 
     # Return 'en' if English words are more frequent, otherwise 'de'
     return "en" if english_count > german_count else "de"
@@ -156,52 +300,71 @@ def preprocess_markdown(markdown_content, language="en-US", no_fallback_fonts=Fa
         language (str): Language code for citations (e.g., "de-DE", "en-US")
         no_fallback_fonts (bool): If True, skip adding font fallback configuration to YAML
     """
+    return "".join(
+        iter_preprocessed_markdown(markdown_content, language, no_fallback_fonts)
+    )
+
+
+def iter_preprocessed_markdown(
+    markdown_content, language="en-US", no_fallback_fonts=False
+):
+    """
+    Generator version of preprocess_markdown that yields the processed document
+    in pieces (YAML front matter, then document body) so that callers can write
+    them out without concatenating the whole document once more.
+    The generator drops its own reference to the input string right away.
+
+    Args:
+        markdown_content (str): The markdown content to process
+        language (str): Language code for citations (e.g., "de-DE", "en-US")
+        no_fallback_fonts (bool): If True, skip adding font fallback configuration to YAML
+
+    Yields:
+        str: Consecutive pieces of the processed document
+    """
+
+    # Each transformation below is skipped when a plain substring check shows
+    # that the document cannot contain what its pattern looks for
 
     # Extract all footnote definitions - handles both single and multi-line footnotes
-    footnote_pattern = r"\[(\^[\w-]+)\]:\s*(.+?)(?=\n\[|\n\n|\Z)"
-    footnotes = re.findall(footnote_pattern, markdown_content, re.DOTALL)
+    footnotes = (
+        _FOOTNOTE_RE.findall(markdown_content) if "[^" in markdown_content else []
+    )
 
     # Always process math expressions and other transformations, even if no footnotes
     content_updated = markdown_content
+    del markdown_content
 
     # Fix math expressions - convert \$ ... \$ or $ ... $ (or mixed) to $ ... $
     # Handles: \$ ... \$ , $ ... $ , \$ ... $ , $ ... \$
-    # Pattern explanation:
-    # - (?:\\\$|\$) matches opening dollar (escaped or unescaped)
-    # - \s* allows optional whitespace after opening dollar
-    # - (.*?) captures content non-greedily (will stop at first closing dollar)
-    # - \s* allows optional whitespace before closing dollar
-    # - (?:\\\$|\$) matches closing dollar (escaped or unescaped)
-    math_pattern = r"(?:\\\$|\$)\s*(.*?)\s*(?:\\\$|\$)"
-    content_updated = re.sub(math_pattern, r"$\1$", content_updated)
+    if "$" in content_updated:
+        content_updated = _MATH_RE.sub(r"$\1$", content_updated)
 
     # Fix centered divs - convert <div style="text-align: center">content</div> and <div align="center">content</div> to LaTeX centering
-    centered_div_pattern = (
-        r'<div (?:style="text-align: center"|align="center")>(.*?)</div>'
-    )
-    content_updated = re.sub(
-        centered_div_pattern, r"\\begin{center}\n\1\n\\end{center}", content_updated
-    )
-
-    # Add horizontal line after all centered characters that don't already have one
-    # Pattern: \end{center} followed by whitespace but not followed by ---
-    content_updated = re.sub(
-        r"(\\end\{center\})\s*(?!\n\s*---)", r"\1\n\n---", content_updated
-    )
+    # and add horizontal line after all centered characters that don't already have one
+    if "<div " in content_updated or "\\end{center}" in content_updated:
+        content_updated = _CENTER_RE.sub(_replace_center, content_updated)
 
     # Clean up extra whitespace that might be left behind
-    # Compress multiple consecutive empty lines to single empty lines
-    content_updated = re.sub(r"\n\n\n+", "\n\n", content_updated)
-    # Remove leading/trailing whitespace from each line and compress multiple spaces
-    content_updated = re.sub(r"[ \t]+", " ", content_updated)
+    # Compress multiple consecutive empty lines to single empty lines and
+    # compress multiple spaces
+    if (
+        "\n\n\n" in content_updated
+        or "  " in content_updated
+        or "\t" in content_updated
+    ):
+        content_updated = _CLEANUP_RE.sub(_cleanup_whitespace, content_updated)
     # Remove empty lines at the beginning and end
     content_updated = content_updated.strip()
 
     if not footnotes:
-        return content_updated
+        yield content_updated
+        return
 
     # Create mapping of unique content to new reference
     unique_references = OrderedDict()
+    # Reverse lookup from content to its reference, to find duplicates quickly
+    content_to_ref = {}
     reference_mapping = {}
     counter = 1
 
@@ -209,154 +372,73 @@ def preprocess_markdown(markdown_content, language="en-US", no_fallback_fonts=Fa
         content_clean = content.strip()
 
         # Check if this content already exists
-        found_existing = False
-        for existing_ref, existing_content in unique_references.items():
-            if existing_content == content_clean:
-                reference_mapping[ref] = existing_ref
-                found_existing = True
-                break
-
-        # If not found, create new unique reference
-        if not found_existing:
+        existing_ref = content_to_ref.get(content_clean)
+        if existing_ref is not None:
+            reference_mapping[ref] = existing_ref
+        else:
+            # If not found, create new unique reference
             new_ref = f"ref{counter}"
             unique_references[new_ref] = content_clean
+            content_to_ref[content_clean] = new_ref
             reference_mapping[ref] = new_ref
             counter += 1
 
     # First, remove all old footnote definitions and standalone reference lines
-    # Pattern to match footnote definitions: [^ref]: content
-    footnote_removal_pattern = r"\[(\^[\w-]+)\]:\s*.*?(?=\n\[|\n\n|\Z)"
-    content_updated = re.sub(
-        footnote_removal_pattern, "", content_updated, flags=re.DOTALL
-    )
-
-    # Also remove any remaining standalone reference lines (lines that start with [^...]:)
-    standalone_ref_pattern = r"^\[(\^[\w-]+)\]:\s*.*$"
-    content_updated = re.sub(
-        standalone_ref_pattern, "", content_updated, flags=re.MULTILINE
-    )
+    content_updated = _FOOTNOTE_REMOVAL_RE.sub("", content_updated)
 
     # Then update all footnote references in text to use proper citation format
-    for old_ref, new_ref in reference_mapping.items():
-        # Escape special regex characters in the old reference
-        old_ref_escaped = re.escape(old_ref)
-        # Convert footnote references to citation format: [^1] -> [@ref1]
-        content_updated = re.sub(
-            f"\\[{old_ref_escaped}\\]", f"[@{new_ref}]", content_updated
-        )
+    # Convert footnote references to citation format in a single pass: [^1] -> [@ref1]
+    footnote_ref_pattern = re.compile(
+        r"\[(" + "|".join(re.escape(ref) for ref in reference_mapping) + r")\]"
+    )
+    content_updated = footnote_ref_pattern.sub(
+        lambda match: f"[@{reference_mapping[match.group(1)]}]", content_updated
+    )
 
     # Consolidate multiple consecutive citations into single bracket pairs
     # Pattern: [@ref1][@ref2][@ref3] -> [@ref1; @ref2; @ref3]
-    def consolidate_citations(match):
-        citations = re.findall(r"\[@(\w+)\]", match.group(0))
-        if len(citations) > 1:
-            return f"[{'; '.join(f'@{ref}' for ref in citations)}]"
-        return match.group(0)
-
-    # Find and consolidate consecutive citation patterns
-    consecutive_citations_pattern = r"(\[@\w+\](?:\[@\w+\])+)"
-    content_updated = re.sub(
-        consecutive_citations_pattern, consolidate_citations, content_updated
-    )
+    if "][@" in content_updated:
+        content_updated = _CONSEC_CITES_RE.sub(_consolidate_citations, content_updated)
 
-    # Handle YAML front matter
-    yaml_start = content_updated.startswith("---\n")
-    if yaml_start:
-        # Find the end of YAML front matter
-        yaml_end = content_updated.find("\n---\n", 4)
-        if yaml_end != -1:
-            yaml_end += 5  # Include the closing ---
-            yaml_content = content_updated[4 : yaml_end - 5]  # Extract YAML without ---
-            document_content = content_updated[yaml_end:]
-        else:
-            # Malformed YAML, treat as no YAML
-            yaml_content = ""
-            document_content = content_updated
-            yaml_start = False
-    else:
+    # Handle YAML front matter; malformed YAML is treated as no YAML
+    yaml_content, document_content = split_front_matter(content_updated)
+    yaml_start = yaml_content is not None
+    if not yaml_start:
         yaml_content = ""
-        document_content = content_updated
 
     # Add bibliography entries to YAML
     if unique_references and yaml_content:
-        # Add references to existing YAML
-        if "references:" not in yaml_content:
-            yaml_content += "\nreferences:\n"
-        for ref, content in unique_references.items():
-            yaml_content += f"  - id: {ref}\n"
-            yaml_content += "    type: webpage\n"
-            yaml_content += f"    URL: {content}\n"
-
-        # Add Nature citation style if not already present (clean numbered style)
-        if "csl:" not in yaml_content:
-            yaml_content += "\ncsl: https://raw.githubusercontent.com/citation-style-language/styles/master/nature.csl\n"
-
-        # Add language for citations if not already present
-        if "lang:" not in yaml_content:
-            yaml_content += f"\nlang: {language}\n"
-
-        # Add link-citations option if not already present
-        if "link-citations:" not in yaml_content:
-            yaml_content += "\nlink-citations: true\n"
-
-        # Add PDF engine and font fallback configuration if not already present
-        if "pdf-engine:" not in yaml_content:
-            yaml_content += "\npdf-engine: lualatex\n"
-        if not no_fallback_fonts:
-            if "mainfontfallback:" not in yaml_content:
-                yaml_content += "\nmainfontfallback:\n"
-                yaml_content += '  - "Noto Emoji:"\n'
-                yaml_content += '  - "DejaVu Serif:"\n'
-                yaml_content += '  - "FreeSerif:"\n'
-            if "sansfontfallback:" not in yaml_content:
-                yaml_content += "\nsansfontfallback:\n"
-                yaml_content += '  - "Noto Emoji:"\n'
-                yaml_content += '  - "DejaVu Serif:"\n'
-                yaml_content += '  - "FreeSerif:"\n'
-            if "monofontfallback:" not in yaml_content:
-                yaml_content += "\nmonofontfallback:\n"
-                yaml_content += '  - "Noto Emoji:"\n'
-                yaml_content += '  - "DejaVu Serif:"\n'
-                yaml_content += '  - "FreeSerif:"\n'
-
-        # Reconstruct document with updated YAML
-        content_updated = f"---\n{yaml_content}---\n{document_content}"
+        # Add references to existing YAML and emit it followed by the document
+        yaml_content = _build_front_matter(
+            yaml_content, unique_references, language, no_fallback_fonts
+        )
+        yield f"---\n{yaml_content}---\n"
+        yield document_content
     elif unique_references and not yaml_start:
         # Create new YAML front matter
-        yaml_content = "---\nreferences:\n"
-        for ref, content in unique_references.items():
-            yaml_content += f"  - id: {ref}\n"
-            yaml_content += "    type: webpage\n"
-            yaml_content += f"    URL: {content}\n"
-        # Add Nature citation style (clean numbered style)
-        yaml_content += "\ncsl: https://raw.githubusercontent.com/citation-style-language/styles/master/nature.csl\n"
-        yaml_content += f"\nlang: {language}\n"
-        yaml_content += "\nlink-citations: true\n"
-        # Add PDF engine and font fallback configuration
-        yaml_content += "\npdf-engine: lualatex\n"
-        if not no_fallback_fonts:
-            yaml_content += "\nmainfontfallback:\n"
-            yaml_content += '  - "Noto Emoji:"\n'
-            yaml_content += '  - "DejaVu Serif:"\n'
-            yaml_content += '  - "FreeSerif:"\n'
-            yaml_content += "\nsansfontfallback:\n"
-            yaml_content += '  - "Noto Emoji:"\n'
-            yaml_content += '  - "DejaVu Serif:"\n'
-            yaml_content += '  - "FreeSerif:"\n'
-            yaml_content += "\nmonofontfallback:\n"
-            yaml_content += '  - "Noto Emoji:"\n'
-            yaml_content += '  - "DejaVu Serif:"\n'
-            yaml_content += '  - "FreeSerif:"\n'
-        yaml_content += "---\n\n"
-        content_updated = yaml_content + document_content
-
-    return content_updated
+        yaml_content = _build_front_matter(
+            "", unique_references, language, no_fallback_fonts
+        )
+        yield f"---\n{yaml_content}---\n\n"
+        yield document_content
+    else:
+        yield content_updated
 
 
-def main():
+def parse_args_with_argparse(argv):
     """
-    Main function that reads from stdin, preprocesses markdown content, and writes to stdout.
+    Parses command line arguments with argparse, which provides the help text
+    and error messages.
+
+    Args:
+        argv (list): Command line arguments without the program name
+
+    Returns:
+        tuple: (language, no_fallback_fonts, mode, check_keys), where mode is
+            None, "server", "batch" or "check"
     """
+    import argparse
+
     parser = argparse.ArgumentParser(
         description="Preprocess markdown content for Pandoc PDF conversion: convert footnotes to citations, fix math expressions, and format references"
     )
@@ -371,24 +453,263 @@ def main():
         action="store_true",
         help="Skip adding font fallback configuration to YAML front matter",
     )
+    mode_group = parser.add_mutually_exclusive_group()
+    mode_group.add_argument(
+        "--server",
+        action="store_const",
+        const="server",
+        dest="mode",
+        help="Keep running and process documents sent on stdin as '<length>\\n<UTF-8 bytes>\\n' frames until end of input, answering each with a frame of the same form",
+    )
 
-    args = parser.parse_args()
+    mode_group.add_argument(
+        "--batch",
+        action="store_const",
+        const="batch",
+        dest="mode",
+        help="Process several documents at once; documents on stdin and results on stdout are separated by a line holding only \\x1e---ENDOFDOC---\\x1e",
+    )
+    mode_group.add_argument(
+        "--check",
+        metavar="KEYS",
+        help="Do not write the processed document, but fail if its YAML front matter contains any of the given comma-separated keys",
+    )
+
+    args = parser.parse_args(argv)
+    if args.check is not None:
+        return args.language, args.no_fallback_fonts, "check", args.check.split(",")
+    return args.language, args.no_fallback_fonts, args.mode, []
+
+
+def parse_args(argv):
+    """
+    Parses command line arguments.
+    The usual forms are handled directly, so argparse is not even imported for
+    a plain invocation. Anything else (help, unknown options, missing values,
+    --language=...) is handed to parse_args_with_argparse.
+
+    Args:
+        argv (list): Command line arguments without the program name
+
+    Returns:
+        tuple: (language, no_fallback_fonts, mode, check_keys), where mode is
+            None, "server", "batch" or "check"
+    """
+    language = "en-US"
+    no_fallback_fonts = False
+    mode = None
+    check_keys = []
+    args = iter(argv)
+    for arg in args:
+        if arg in ("-l", "--language"):
+            language = next(args, None)
+            if language is None or language.startswith("-"):
+                break
+        elif arg == "--no-fallback-fonts":
+            no_fallback_fonts = True
+        elif arg in ("--server", "--batch") and mode in (None, arg[2:]):
+            mode = arg[2:]
+        elif arg == "--check" and mode is None:
+            mode = "check"
+            keys = next(args, None)
+            if keys is None or keys.startswith("-"):
+                break
+            check_keys = keys.split(",")
+        else:
+            break
+    else:
+        return language, no_fallback_fonts, mode, check_keys
+
+    return parse_args_with_argparse(argv)
+
+
+def get_cache_file(cache_dir, markdown_content, language, no_fallback_fonts):
+    """
+    Returns the cache file for the given input and options.
+    The key also covers this script's modification time, so that cached
+    results are not reused after the script has changed.
+
+    Args:
+        cache_dir (str): Directory holding cached results
+        markdown_content (str): The markdown content to process
+        language (str): Language code for citations (e.g., "de-DE", "en-US")
+        no_fallback_fonts (bool): If True, skip adding font fallback configuration to YAML
+
+    Returns:
+        str: Path of the cache file (which may not exist yet)
+    """
+    import hashlib
+
+    script_mtime = os.stat(__file__).st_mtime_ns
+    key = hashlib.blake2b(
+        f"{script_mtime}|{language}|{no_fallback_fonts}|".encode("utf-8")
+        + markdown_content.encode("utf-8")
+    ).hexdigest()
+    return os.path.join(cache_dir, f"{key}.md")
 
-    # Handle language shortcuts
-    language_map = {"de": "de-DE", "en": "en-US"}
-    language = language_map.get(args.language, args.language)
 
+def write_cache_file(cache_file, processed_content):
+    """
+    Stores a processed document in the cache. The file is written under a
+    temporary name first, so concurrent readers never see partial content.
+    Failing to write the cache is not an error.
+
+    Args:
+        cache_file (str): Path returned by get_cache_file
+        processed_content (str): The processed markdown content
+    """
     try:
-        # Read entire input from stdin
-        markdown_content = sys.stdin.read()
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        temp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            f.write(processed_content)
+        os.replace(temp_file, cache_file)
+    except OSError:
+        pass
+
+
+def find_front_matter_keys(processed_content, keys):
+    """
+    Finds which of the given top-level keys appear in the YAML front matter
+    of a processed document.
+
+    Args:
+        processed_content (str): The processed markdown content
+        keys (list): Keys to look for
+
+    Returns:
+        list: The keys found, in the given order
+    """
+    yaml_content, _ = split_front_matter(processed_content)
+    if yaml_content is None:
+        return []
+    front_matter_keys = {
+        line.split(":", 1)[0]
+        for line in yaml_content.split("\n")
+        if line[:1] not in ("", " ", "\t", "-")
+    }
+    return [key for key in keys if key in front_matter_keys]
+
+
+def read_frame(stream):
+    """
+    Reads one frame of the form "<length>\\n<bytes>\\n" from a binary stream.
+
+    Args:
+        stream: Binary stream to read from
+
+    Returns:
+        bytes: The frame content, or None at the end of the stream
+    """
+    header = stream.readline()
+    if not header:
+        return None
+    length = int(header)
+    content = stream.read(length)
+    if len(content) != length or stream.read(1) != b"\n":
+        raise ValueError("Truncated frame")
+    return content
+
+
+def write_frame(stream, content):
+    """
+    Writes one frame of the form "<length>\\n<bytes>\\n" to a binary stream
+    and flushes it, so that the reader can pick it up right away.
 
-        # Process the content
+    Args:
+        stream: Binary stream to write to
+        content (bytes): The frame content
+    """
+    stream.write(b"%d\n" % len(content))
+    stream.write(content)
+    stream.write(b"\n")
+    stream.flush()
+
+
+def serve(input_stream, output_stream, language, no_fallback_fonts):
+    """
+    Processes documents until the end of the input, so that a caller with many
+    documents pays for the interpreter startup only once. Every document is
+    sent as a frame of UTF-8 bytes and answered with a frame holding the
+    processed document.
+
+    Args:
+        input_stream: Binary stream to read document frames from
+        output_stream: Binary stream to write processed document frames to
+        language (str): Language code for citations (e.g., "de-DE", "en-US")
+        no_fallback_fonts (bool): If True, skip adding font fallback configuration to YAML
+    """
+    while True:
+        content = read_frame(input_stream)
+        if content is None:
+            return
         processed_content = preprocess_markdown(
-            markdown_content, language, args.no_fallback_fonts
+            content.decode("utf-8"), language, no_fallback_fonts
         )
+        write_frame(output_stream, processed_content.encode("utf-8"))
+
 
-        # Output to stdout
-        sys.stdout.write(processed_content)
+def main():
+    """
+    Main function that reads from stdin, preprocesses markdown content, and writes to stdout.
+    """
+    language, no_fallback_fonts, mode, check_keys = parse_args(sys.argv[1:])
+
+    # Handle language shortcuts
+    language_map = {"de": "de-DE", "en": "en-US"}
+    language = language_map.get(language, language)
+
+    try:
+        if mode == "server":
+            serve(sys.stdin.buffer, sys.stdout.buffer, language, no_fallback_fonts)
+            return
+
+        if mode == "batch":
+            # Process all documents from stdin, keeping them in order
+            sys.stdout.write(
+                BATCH_SEPARATOR.join(
+                    preprocess_markdown(document, language, no_fallback_fonts)
+                    for document in sys.stdin.read().split(BATCH_SEPARATOR)
+                )
+            )
+            return
+
+        if mode == "check":
+            found_keys = find_front_matter_keys(
+                preprocess_markdown(sys.stdin.read(), language, no_fallback_fonts),
+                check_keys,
+            )
+            if found_keys:
+                print(
+                    f"Error: front matter contains {', '.join(found_keys)}",
+                    file=sys.stderr,
+                )
+                sys.exit(1)
+            return
+
+        cache_dir = os.environ.get("PERPLEXITY_CACHE_DIR")
+        if cache_dir:
+            # Read entire input from stdin and reuse a cached result for it
+            markdown_content = sys.stdin.read()
+            cache_file = get_cache_file(
+                cache_dir, markdown_content, language, no_fallback_fonts
+            )
+            try:
+                with open(cache_file, "r", encoding="utf-8") as f:
+                    processed_content = f.read()
+            except OSError:
+                processed_content = preprocess_markdown(
+                    markdown_content, language, no_fallback_fonts
+                )
+                write_cache_file(cache_file, processed_content)
+            sys.stdout.write(processed_content)
+            return
+
+        # Read entire input from stdin, process the content and write it to
+        # stdout piece by piece; the input is not kept alive by this frame
+        sys.stdout.writelines(
+            iter_preprocessed_markdown(sys.stdin.read(), language, no_fallback_fonts)
+        )
 
     except KeyboardInterrupt:
         sys.exit(1)
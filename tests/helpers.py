@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+
+"""
+Helpers for running the perplexity-tools shell functions in tests
+"""
+
+import asyncio
+import atexit
+import hashlib
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from test_config import TEST_DATA_DIR, get_script_path, get_test_file_path
+
+# Names of the available test data files, listed once so that tests can be
+# skipped up front when their test file is missing
+try:
+    TEST_DATA_FILES = frozenset(entry.name for entry in os.scandir(TEST_DATA_DIR))
+except OSError:
+    TEST_DATA_FILES = frozenset()
+
+# Results of successful conversions in this test process, keyed by a hash of
+# the scripts involved, the input file content and the options
+_OUTPUT_CACHE = {}
+
+# Results of successful preprocessing runs in this test process
+_PREPROCESS_CACHE = {}
+
+# Running preprocess servers, keyed by language
+_PREPROCESS_SERVERS = {}
+
+# File with the exported shell function definitions, once written
+_FUNCTIONS_FILE = None
+
+# Shell functions defined by the scripts, keyed by script name
+SHELL_FUNCTIONS = {
+    "md_to_md": "perplexity-md-to-md",
+    "md_to_pdf": "perplexity-md-to-pdf",
+}
+
+
+def get_output_path(input_file, suffix):
+    """Get the output path the shell functions derive from an input file"""
+    input_path = Path(input_file)
+    stem = input_path.name[:-3] if input_path.name.endswith(".md") else input_path.name
+    return input_path.parent / f"{stem}{suffix}"
+
+
+def requires_test_file(filename):
+    """Skip a test if the given test data file is not available"""
+    return unittest.skipIf(
+        filename not in TEST_DATA_FILES, f"Test file not found: {filename}"
+    )
+
+
+def assert_nonempty_file(test_case, path, description):
+    """Assert that a file exists and is not empty, with a single stat call"""
+    try:
+        size = os.stat(path).st_size
+    except FileNotFoundError:
+        test_case.fail(f"{description} was not created")
+    test_case.assertGreater(size, 0, f"{description} is empty")
+
+
+def assert_all_in(test_case, expected, content):
+    """Assert that content contains all expected strings, reporting all missing"""
+    missing = [text for text in expected if text not in content]
+    test_case.assertEqual(missing, [], "Expected text missing from output")
+
+
+def get_front_matter_lines(text):
+    """Get the lines of the YAML front matter at the start of a document"""
+    if not text.startswith("---\n"):
+        return []
+    end = text.find("\n---\n", 4)
+    if end == -1:
+        return []
+    return text[4:end].split("\n")
+
+
+def copy_test_file(filename, directory):
+    """
+    Copy a test data file into a directory, so that outputs written next to
+    it stay out of the shared test data directory
+    """
+    copy = Path(directory) / filename
+    shutil.copyfile(get_test_file_path(filename), copy)
+    return copy
+
+
+def get_cache_key(input_file, script_names, options):
+    """Get the cache key for a conversion, or None if the input is unreadable"""
+    try:
+        input_content = Path(input_file).read_bytes()
+    except OSError:
+        return None
+    return get_content_cache_key(input_content, script_names, options)
+
+
+def get_content_cache_key(input_content, script_names, options):
+    """Get the cache key for converting the given input bytes"""
+    digest = hashlib.sha256()
+    for script_name in script_names:
+        digest.update(get_script_path(script_name).read_bytes())
+    digest.update(input_content)
+    digest.update(repr(options).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def export_shell_functions():
+    """
+    Make the shell functions available to every bash started by the tests.
+    The scripts are sourced only once per test run, when the first command
+    needs them; the definitions printed by `declare -f` are written to a file
+    that bash reads at startup, as it is named in BASH_ENV. Failing to source
+    the scripts fails the test that needs them.
+    """
+    global _FUNCTIONS_FILE
+    if _FUNCTIONS_FILE is not None:
+        return
+
+    sources = " && ".join(
+        f"source '{get_script_path(script_name)}'" for script_name in SHELL_FUNCTIONS
+    )
+    functions = " ".join(SHELL_FUNCTIONS.values())
+    result = subprocess.run(
+        ["bash", "-c", f"{sources} && declare -f {functions}"],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise AssertionError(f"Sourcing the scripts failed: {result.stderr}")
+
+    fd, functions_file = tempfile.mkstemp(prefix="perplexity-tools-", suffix=".sh")
+    with os.fdopen(fd, "w") as f:
+        f.write(result.stdout)
+    atexit.register(os.unlink, functions_file)
+    _FUNCTIONS_FILE = functions_file
+    os.environ["BASH_ENV"] = functions_file
+
+
+def get_function_command(function_name, args):
+    """Get a bash command that runs a shell function with the given arguments"""
+    export_shell_functions()
+    return ["bash", "-c", shlex.join([function_name, *(str(arg) for arg in args)])]
+
+
+def run_cached(cmd, input_file, output_file, script_names, options):
+    """
+    Run a conversion command that writes output_file from input_file.
+    Successful conversions are cached, so running the same conversion again
+    only writes the cached output and returns the cached result.
+    """
+    key = get_cache_key(input_file, script_names, options)
+    if key in _OUTPUT_CACHE:
+        result, output_content = _OUTPUT_CACHE[key]
+        output_file.write_bytes(output_content)
+        return result
+
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if key is not None and result.returncode == 0 and output_file.is_file():
+        _OUTPUT_CACHE[key] = (result, output_file.read_bytes())
+    return result
+
+
+def run_md_to_md(input_file):
+    """Run perplexity-md-to-md on a file"""
+    cmd = get_function_command("perplexity-md-to-md", [input_file])
+    output_file = get_output_path(input_file, "-fixed.md")
+    return run_cached(cmd, input_file, output_file, ("md_to_md",), ())
+
+
+def run_md_to_pdf(input_file, options=(), env=None):
+    """
+    Run perplexity-md-to-pdf with the given command line options on a file.
+    Runs with a custom environment are not cached.
+    """
+    cmd = get_function_command("perplexity-md-to-pdf", [*options, input_file])
+    if env is not None:
+        return subprocess.run(cmd, capture_output=True, text=True, env=env)
+
+    output_file = get_output_path(input_file, ".pdf")
+    return run_cached(
+        cmd, input_file, output_file, ("md_to_pdf", "preprocess"), tuple(options)
+    )
+
+
+def get_home_env(home_dir):
+    """
+    Get an environment in which ~ expands to home_dir.
+    pandoc and TeX keep using the data directories of the real home, so that
+    templates, packages and font caches installed there are still found.
+    """
+    # The environment is copied, so the shell functions need to be in it
+    export_shell_functions()
+    env = dict(os.environ)
+    env.setdefault("XDG_DATA_HOME", str(Path.home() / ".local" / "share"))
+
+    # pandoc only uses its legacy data directory ~/.pandoc if it exists under
+    # $HOME, which XDG_DATA_HOME cannot point to; link the real user data
+    # directory into home_dir, so that a template installed there is found
+    if shutil.which("pandoc"):
+        result = subprocess.run(["pandoc", "--version"], capture_output=True, text=True)
+        for line in result.stdout.splitlines():
+            if line.startswith("User data directory:"):
+                data_dir = Path(line.split(":", 1)[1].strip()).expanduser()
+                if data_dir.is_dir() and data_dir.is_relative_to(Path.home()):
+                    link = Path(home_dir) / data_dir.relative_to(Path.home())
+                    link.parent.mkdir(parents=True, exist_ok=True)
+                    link.symlink_to(data_dir)
+                break
+
+    if shutil.which("kpsewhich"):
+        for name in ("TEXMFHOME", "TEXMFVAR", "TEXMFCONFIG"):
+            if name not in env:
+                result = subprocess.run(
+                    ["kpsewhich", f"-var-value={name}"],
+                    capture_output=True,
+                    text=True,
+                )
+                if result.returncode == 0 and result.stdout.strip():
+                    env[name] = result.stdout.strip()
+    env["HOME"] = str(home_dir)
+    return env
+
+
+async def _run_async(cmd, semaphore):
+    """Run a command without blocking the event loop"""
+    async with semaphore:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        stdout, stderr = await proc.communicate()
+    return subprocess.CompletedProcess(
+        cmd, proc.returncode, stdout.decode("utf-8"), stderr.decode("utf-8")
+    )
+
+
+async def _prefetch_md_to_pdf(conversions, temp_dir):
+    semaphore = asyncio.Semaphore(os.cpu_count() or 1)
+    jobs = []
+    for index, (filename, options) in enumerate(conversions):
+        if filename not in TEST_DATA_FILES:
+            continue
+        job_dir = Path(temp_dir) / str(index)
+        job_dir.mkdir()
+        input_file = copy_test_file(filename, job_dir)
+        key = get_cache_key(input_file, ("md_to_pdf", "preprocess"), tuple(options))
+        if key in _OUTPUT_CACHE:
+            continue
+        cmd = get_function_command("perplexity-md-to-pdf", [*options, input_file])
+        jobs.append((key, get_output_path(input_file, ".pdf"), cmd))
+
+    results = await asyncio.gather(*(_run_async(cmd, semaphore) for _, _, cmd in jobs))
+    for (key, output_file, _), result in zip(jobs, results):
+        if result.returncode == 0 and output_file.is_file():
+            _OUTPUT_CACHE[key] = (result, output_file.read_bytes())
+
+
+def prefetch_md_to_pdf(conversions):
+    """
+    Run several md-to-pdf conversions of test data files concurrently and
+    cache their results, so that tests running them later only pick up the
+    cached output. conversions is a sequence of (filename, options) pairs.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        asyncio.run(_prefetch_md_to_pdf(conversions, temp_dir))
+
+
+def stop_preprocess_servers():
+    """Stop the preprocess servers started by run_preprocess"""
+    while _PREPROCESS_SERVERS:
+        _, server = _PREPROCESS_SERVERS.popitem()
+        server.stdin.close()
+        server.wait()
+        server.stdout.close()
+        server.stderr.close()
+
+
+def get_preprocess_server(language):
+    """
+    Get a running perplexity-preprocess-md.py --server process for a language.
+    One process per language is started and kept for the rest of the test run.
+    """
+    server = _PREPROCESS_SERVERS.get(language)
+    if server is None:
+        cmd = [
+            sys.executable,
+            str(get_script_path("preprocess")),
+            "-l",
+            language,
+            "--server",
+        ]
+        server = subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        _PREPROCESS_SERVERS[language] = server
+    return server
+
+
+def run_preprocess(input_content, language="en-US"):
+    """
+    Run perplexity-preprocess-md.py with the given language on markdown bytes.
+    The documents are sent to a preprocess server, so the interpreter starts
+    only once per language. Input and output stay bytes, so they pass through
+    without being decoded and encoded again. The output only depends on the
+    script, the input and the language, so successful runs are cached for the
+    rest of the test run.
+    """
+    key = get_content_cache_key(input_content, ("preprocess",), (language,))
+    if key in _PREPROCESS_CACHE:
+        return _PREPROCESS_CACHE[key]
+
+    server = get_preprocess_server(language)
+    try:
+        server.stdin.write(b"%d\n%b\n" % (len(input_content), input_content))
+        server.stdin.flush()
+        length = int(server.stdout.readline())
+        output = server.stdout.read(length + 1)[:-1]
+        if len(output) != length:
+            raise ValueError("Truncated frame")
+    except (OSError, ValueError):
+        # The server stops on errors; report its exit status and messages
+        del _PREPROCESS_SERVERS[language]
+        server.stdin.close()
+        returncode = server.wait()
+        stderr = server.stderr.read()
+        server.stdout.close()
+        server.stderr.close()
+        return subprocess.CompletedProcess(server.args, returncode, b"", stderr)
+
+    result = subprocess.CompletedProcess(server.args, 0, output, b"")
+    _PREPROCESS_CACHE[key] = result
+    return result
+
+
+atexit.register(stop_preprocess_servers)
@@ -1,91 +1,146 @@
 #!/usr/bin/env python3
 
+import json
+import os
+import shutil
 import subprocess
 import sys
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 
-def check_dependencies():
-    """Check if required dependencies are available"""
-    print("Checking dependencies...")
+DEPS_CACHE_FILE = Path(__file__).parent / ".deps_cache.json"
 
-    # Check if pandoc is available
+
+def load_deps_cache():
+    """Load cached dependency probe results, if any"""
     try:
-        result = subprocess.run(["pandoc", "--version"], capture_output=True, text=True)
-        if result.returncode == 0:
-            print("✓ pandoc is available")
-        else:
-            print("✗ pandoc is not available")
-            return False
-    except FileNotFoundError:
-        print("✗ pandoc is not installed")
-        return False
+        with open(DEPS_CACHE_FILE, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
-    # Check if lualatex is available
+
+def save_deps_cache(cache):
+    """Save dependency probe results for subsequent test runs"""
     try:
+        with open(DEPS_CACHE_FILE, "w") as f:
+            json.dump(cache, f)
+    except OSError:
+        pass
+
+
+def tool_fingerprint(name):
+    """Identify the installed version of a tool by its executable path and mtime"""
+    path = shutil.which(name)
+    if path is None:
+        return None
+    return f"{path}:{os.stat(path).st_mtime_ns}"
+
+
+def find_eisvogel_template():
+    """Look for the eisvogel template in pandoc's user data directory"""
+    result = subprocess.run(["pandoc", "--version"], capture_output=True, text=True)
+    for line in result.stdout.splitlines():
+        if line.startswith("User data directory:"):
+            data_dir = Path(line.split(":", 1)[1].strip()).expanduser()
+            return (data_dir / "templates" / "eisvogel.latex").is_file()
+    return False
+
+
+def probe_eisvogel_conversion():
+    """Check if eisvogel template is available by testing conversion"""
+    # Create a temporary test markdown file
+    test_md_content = "# Test Document\n\nThis is a test document for eisvogel template validation."
+    test_md_file = Path("test_eisvogel.md")
+    test_pdf_file = Path("test_eisvogel.pdf")
+    eisvogel_found = False
+
+    try:
+        # Write test markdown file
+        with open(test_md_file, "w") as f:
+            f.write(test_md_content)
+
+        # Try to convert with eisvogel template
         result = subprocess.run(
-            ["lualatex", "--version"], capture_output=True, text=True
+            [
+                "pandoc",
+                str(test_md_file),
+                "-o",
+                str(test_pdf_file),
+                "--template",
+                "eisvogel",
+            ],
+            capture_output=True,
+            text=True,
         )
-        if result.returncode == 0:
-            print("✓ lualatex is available")
-        else:
-            print("✗ lualatex is not available")
-            return False
-    except FileNotFoundError:
-        print("✗ lualatex is not installed")
-        return False
 
-    # Check if eisvogel template is available by testing conversion
+        if result.returncode == 0 and test_pdf_file.exists():
+            eisvogel_found = True
+
+    except Exception:
+        # If the test fails, eisvogel is not available
+        pass
+    finally:
+        # Clean up test files
+        if test_md_file.exists():
+            test_md_file.unlink()
+        if test_pdf_file.exists():
+            test_pdf_file.unlink()
+
+    return eisvogel_found
+
+
+def probe_tool(name):
+    """Run '<name> --version' and return (status line, whether it is available)"""
     try:
-        # Create a temporary test markdown file
-        test_md_content = "# Test Document\n\nThis is a test document for eisvogel template validation."
-        test_md_file = Path("test_eisvogel.md")
-        test_pdf_file = Path("test_eisvogel.pdf")
-        eisvogel_found = False
+        # Only the return code matters, so the version banner is discarded
+        result = subprocess.run(
+            [name, "--version"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        if result.returncode == 0:
+            return f"✓ {name} is available", True
+        return f"✗ {name} is not available", False
+    except FileNotFoundError:
+        return f"✗ {name} is not installed", False
 
-        try:
-            # Write test markdown file
-            with open(test_md_file, "w") as f:
-                f.write(test_md_content)
-
-            # Try to convert with eisvogel template
-            result = subprocess.run(
-                [
-                    "pandoc",
-                    str(test_md_file),
-                    "-o",
-                    str(test_pdf_file),
-                    "--template",
-                    "eisvogel",
-                ],
-                capture_output=True,
-                text=True,
-            )
 
-            if result.returncode == 0 and test_pdf_file.exists():
-                eisvogel_found = True
+def check_dependencies():
+    """Check if required dependencies are available"""
+    print("Checking dependencies...")
 
-        except Exception:
-            # If the test fails, eisvogel is not available
-            pass
-        finally:
-            # Clean up test files
-            if test_md_file.exists():
-                test_md_file.unlink()
-            if test_pdf_file.exists():
-                test_pdf_file.unlink()
+    # Check if pandoc and lualatex are available. Both probes run concurrently
+    # and their status lines are printed in a fixed order once both are done.
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        probes = list(executor.map(probe_tool, ["pandoc", "lualatex"]))
+    for status, _ in probes:
+        print(status)
+    if not all(available for _, available in probes):
+        return False
 
+    # Check if eisvogel template is available. The result is cached per
+    # pandoc/lualatex executable, so the probe only reruns when a tool changes.
+    versions = {tool: tool_fingerprint(tool) for tool in ("pandoc", "lualatex")}
+    cache = load_deps_cache()
+    if cache.get("eisvogel") and all(
+        cache.get(tool) == version for tool, version in versions.items()
+    ):
+        eisvogel_found = True
+    else:
+        # Look the template up on disk first and only fall back to a full
+        # pandoc/LuaLaTeX conversion if it is installed somewhere else
+        eisvogel_found = find_eisvogel_template()
+        if not eisvogel_found:
+            eisvogel_found = probe_eisvogel_conversion()
         if eisvogel_found:
-            print("✓ eisvogel template is available")
-        else:
-            print("✗ eisvogel template is not available")
-            print(
-                "  Install from: https://github.com/Wandmalfarbe/pandoc-latex-template"
-            )
-            return False
-    except FileNotFoundError:
+            save_deps_cache({**versions, "eisvogel": True})
+
+    if eisvogel_found:
+        print("✓ eisvogel template is available")
+    else:
         print("✗ eisvogel template is not available")
+        print("  Install from: https://github.com/Wandmalfarbe/pandoc-latex-template")
         return False
 
     return True
@@ -5,58 +5,79 @@ Test configuration for perplexity-tools test suite
 """
 
 from pathlib import Path
+from types import MappingProxyType
 
-# Test configuration
-TEST_CONFIG = {
-    # Paths
-    "project_root": Path(__file__).parent.parent,
-    "test_data_dir": Path(__file__).parent / "test_data",
-    "output_dir": Path(__file__).parent / "output",
-    # Test files
-    "test_files": {
+# Paths, resolved once at import time
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+TEST_DATA_DIR = PROJECT_ROOT / "tests" / "test_data"
+OUTPUT_DIR = PROJECT_ROOT / "tests" / "output"
+
+# Test files
+TEST_FILES = MappingProxyType(
+    {
         "simple": "simple_document.md",
         "with_tables": "document_with_tables.md",
         "complex": "complex_document.md",
         "german": "german_document.md",
-    },
-    # Script paths
-    "scripts": {
+    }
+)
+
+# Script paths, relative to the project root
+SCRIPTS = MappingProxyType(
+    {
         "preprocess": "perplexity-preprocess-md.py",
         "md_to_md": "perplexity-md-to-md",
         "md_to_pdf": "perplexity-md-to-pdf",
-    },
-    # Test settings
-    "cleanup_after_tests": True,
-    "verbose_output": True,
-    # Dependencies to check
-    "dependencies": ["pandoc", "lualatex"],
-    # Pandoc templates to check
-    "pandoc_templates": ["eisvogel"],
-}
+    }
+)
+
+# Full script paths
+SCRIPT_PATHS = MappingProxyType(
+    {name: PROJECT_ROOT / script for name, script in SCRIPTS.items()}
+)
+
+# Test configuration (read-only)
+TEST_CONFIG = MappingProxyType(
+    {
+        # Paths
+        "project_root": PROJECT_ROOT,
+        "test_data_dir": TEST_DATA_DIR,
+        "output_dir": OUTPUT_DIR,
+        # Test files
+        "test_files": TEST_FILES,
+        # Script paths
+        "scripts": SCRIPTS,
+        # Test settings
+        "cleanup_after_tests": True,
+        "verbose_output": True,
+        # Dependencies to check
+        "dependencies": ("pandoc", "lualatex"),
+        # Pandoc templates to check
+        "pandoc_templates": ("eisvogel",),
+    }
+)
 
 
 def get_test_file_path(filename):
     """Get full path to a test file"""
-    return TEST_CONFIG["test_data_dir"] / filename
+    return TEST_DATA_DIR / filename
 
 
 def get_script_path(script_name):
     """Get full path to a script"""
-    return TEST_CONFIG["project_root"] / TEST_CONFIG["scripts"][script_name]
+    return SCRIPT_PATHS[script_name]
 
 
 def ensure_output_dir():
     """Ensure output directory exists"""
-    output_dir = TEST_CONFIG["output_dir"]
-    output_dir.mkdir(exist_ok=True)
-    return output_dir
+    OUTPUT_DIR.mkdir(exist_ok=True)
+    return OUTPUT_DIR
 
 
 def cleanup_output_dir():
     """Clean up output directory"""
     if TEST_CONFIG["cleanup_after_tests"]:
-        output_dir = TEST_CONFIG["output_dir"]
-        if output_dir.exists():
-            for file in output_dir.glob("*"):
+        if OUTPUT_DIR.exists():
+            for file in OUTPUT_DIR.glob("*"):
                 if file.is_file():
                     file.unlink()
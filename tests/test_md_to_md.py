@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 
 import os
-import subprocess
+import shutil
 import sys
 import tempfile
 import unittest
@@ -11,26 +11,54 @@ from pathlib import Path
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
+# Add the tests directory to the Python path, so that the test helpers can
+# be imported when the tests are run from the project root
+sys.path.insert(0, str(Path(__file__).parent))
+
+import helpers
+
+# Text expected in the md-to-md output of the test documents
+MATH_CONVERSION_EXPECTED = (
+    "$x = y + z$",
+    "$E = mc^2$",
+    "$\\int_{-\\infty}^{\\infty} e^{-x^2} dx = \\sqrt{\\pi}$",
+)
+TABLES_DOCUMENT_EXPECTED = (
+    "$E = mc^2$",
+    "$\\sum_{i=1}^{n} x_i$",
+    "| Name | Age | City |",
+    "| Product | Price | Stock |",
+)
+COMPLEX_DOCUMENT_EXPECTED = (
+    "$\\int_{-\\infty}^{\\infty} e^{-x^2} dx = \\sqrt{\\pi}$",
+    "$\\frac{\\partial f}{\\partial x} = \\lim_{h \\to 0} \\frac{f(x+h) - f(x)}{h}$",
+    "$\\nabla \\cdot \\vec{E} = \\frac{\\rho}{\\epsilon_0}$",
+    "title: Complex Document",
+    "author: Test Author",
+    "| Metric | Value | Unit |",
+)
+GERMAN_DOCUMENT_EXPECTED = (
+    "$a^2 + b^2 = c^2$",
+    "Deutsches Dokument",
+    "Einführung",
+    "| Name | Alter | Stadt |",
+)
+
 
 class TestPerplexityMdToMd(unittest.TestCase):
     """Test cases for perplexity-md-to-md script"""
 
     def setUp(self):
         """Set up test environment"""
-        self.script_path = project_root / "perplexity-md-to-md"
-        self.test_data_dir = Path(__file__).parent / "test_data"
+        # Outputs are written next to the input, so tests work on copies of
+        # the test data in their own directory
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, ignore_errors=True)
 
     def run_md_to_md(self, input_file):
         """Helper method to run the md-to-md script"""
-        # Source the script and run the function
-        cmd = [
-            "bash",
-            "-c",
-            f"source '{self.script_path}' && perplexity-md-to-md '{input_file}'",
-        ]
-
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        return result
+        # Identical conversions within a test run are served from a cache
+        return helpers.run_md_to_md(input_file)
 
     def test_math_expression_conversion(self):
         """Test math expression conversion in md-to-md"""
@@ -57,16 +85,10 @@ Complex math: \\$ \\int_{-\\infty}^{\\infty} e^{-x^2} dx = \\sqrt{\\pi} \\$
             self.assertTrue(os.path.exists(output_file), "Output file was not created")
 
             # Read and check the output
-            with open(output_file, "r") as f:
-                output_content = f.read()
+            output_content = Path(output_file).read_text()
 
             # Check that escaped dollar signs are converted
-            self.assertIn("$x = y + z$", output_content)
-            self.assertIn("$E = mc^2$", output_content)
-            self.assertIn(
-                "$\\int_{-\\infty}^{\\infty} e^{-x^2} dx = \\sqrt{\\pi}$",
-                output_content,
-            )
+            helpers.assert_all_in(self, MATH_CONVERSION_EXPECTED, output_content)
 
             # Check that original escaped versions are not present
             self.assertNotIn("\\$ x = y + z \\$", output_content)
@@ -80,135 +102,126 @@ Complex math: \\$ \\int_{-\\infty}^{\\infty} e^{-x^2} dx = \\sqrt{\\pi} \\$
             if os.path.exists(output_file):
                 os.unlink(output_file)
 
-    def test_simple_document(self):
-        """Test processing simple document from test_data"""
-        test_file = self.test_data_dir / "simple_document.md"
-        if test_file.exists():
-            result = self.run_md_to_md(str(test_file))
+    def test_math_expression_edge_cases(self):
+        """Test math conversion with backslashes, several expressions and no spaces"""
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".md", delete=False) as f:
+            f.write("""Escaped braces: \\$ \\{ a \\} \\$
+
+Two expressions: \\$ a \\$ and \\$ b \\$
+
+Unclosed: \\$ a
+
+No spaces: \\$a\\$
+""")
+            input_file = f.name
+
+        try:
+            result = self.run_md_to_md(input_file)
 
             # Check that the script ran successfully
             self.assertEqual(result.returncode, 0, f"Script failed: {result.stderr}")
 
-            # Check that output file was created
-            output_file = test_file.parent / "simple_document-fixed.md"
-            self.assertTrue(output_file.exists(), "Output file was not created")
-
             # Read and check the output
-            with open(output_file, "r") as f:
-                output_content = f.read()
+            output_file = input_file.replace(".md", "-fixed.md")
+            output_content = Path(output_file).read_text()
 
-            # Check that math expressions are converted
-            self.assertIn("$x = y + z$", output_content)
-            self.assertNotIn("\\$ x = y + z \\$", output_content)
+            # Escaped characters inside math are kept
+            self.assertIn("Escaped braces: $\\{ a \\}$", output_content)
+            # Each expression on a line is converted separately
+            self.assertIn("Two expressions: $a$ and $b$", output_content)
+            # Unclosed and unpadded expressions are left alone
+            self.assertIn("Unclosed: \\$ a", output_content)
+            self.assertIn("No spaces: \\$a\\$", output_content)
 
+        finally:
             # Clean up
-            if output_file.exists():
-                output_file.unlink()
+            if os.path.exists(input_file):
+                os.unlink(input_file)
+            output_file = input_file.replace(".md", "-fixed.md")
+            if os.path.exists(output_file):
+                os.unlink(output_file)
 
-    def test_document_with_tables(self):
-        """Test processing document with tables"""
-        test_file = self.test_data_dir / "document_with_tables.md"
-        if test_file.exists():
-            result = self.run_md_to_md(str(test_file))
+    @helpers.requires_test_file("simple_document.md")
+    def test_simple_document(self):
+        """Test processing simple document from test_data"""
+        test_file = helpers.copy_test_file("simple_document.md", self.temp_dir)
+        result = self.run_md_to_md(test_file)
 
-            # Check that the script ran successfully
-            self.assertEqual(result.returncode, 0, f"Script failed: {result.stderr}")
+        # Check that the script ran successfully
+        self.assertEqual(result.returncode, 0, f"Script failed: {result.stderr}")
 
-            # Check that output file was created
-            output_file = test_file.parent / "document_with_tables-fixed.md"
-            self.assertTrue(output_file.exists(), "Output file was not created")
+        # Check that output file was created
+        output_file = test_file.parent / "simple_document-fixed.md"
+        self.assertTrue(output_file.exists(), "Output file was not created")
 
-            # Read and check the output
-            with open(output_file, "r") as f:
-                output_content = f.read()
+        # Read and check the output
+        output_content = output_file.read_text()
 
-            # Check that math expressions are converted
-            self.assertIn("$E = mc^2$", output_content)
-            self.assertIn("$\\sum_{i=1}^{n} x_i$", output_content)
-            self.assertNotIn("\\$ E = mc^2 \\$", output_content)
-            self.assertNotIn("\\$ \\sum_{i=1}^{n} x_i \\$", output_content)
+        # Check that math expressions are converted
+        self.assertIn("$x = y + z$", output_content)
+        self.assertNotIn("\\$ x = y + z \\$", output_content)
 
-            # Check that tables are preserved
-            self.assertIn("| Name | Age | City |", output_content)
-            self.assertIn("| Product | Price | Stock |", output_content)
+    @helpers.requires_test_file("document_with_tables.md")
+    def test_document_with_tables(self):
+        """Test processing document with tables"""
+        test_file = helpers.copy_test_file("document_with_tables.md", self.temp_dir)
+        result = self.run_md_to_md(test_file)
 
-            # Clean up
-            if output_file.exists():
-                output_file.unlink()
+        # Check that the script ran successfully
+        self.assertEqual(result.returncode, 0, f"Script failed: {result.stderr}")
+
+        # Check that output file was created
+        output_file = test_file.parent / "document_with_tables-fixed.md"
+        self.assertTrue(output_file.exists(), "Output file was not created")
 
+        # Read and check the output
+        output_content = output_file.read_text()
+
+        # Check that math expressions are converted and tables are preserved
+        helpers.assert_all_in(self, TABLES_DOCUMENT_EXPECTED, output_content)
+        self.assertNotIn("\\$ E = mc^2 \\$", output_content)
+        self.assertNotIn("\\$ \\sum_{i=1}^{n} x_i \\$", output_content)
+
+    @helpers.requires_test_file("complex_document.md")
     def test_complex_document(self):
         """Test processing complex document"""
-        test_file = self.test_data_dir / "complex_document.md"
-        if test_file.exists():
-            result = self.run_md_to_md(str(test_file))
+        test_file = helpers.copy_test_file("complex_document.md", self.temp_dir)
+        result = self.run_md_to_md(test_file)
 
-            # Check that the script ran successfully
-            self.assertEqual(result.returncode, 0, f"Script failed: {result.stderr}")
+        # Check that the script ran successfully
+        self.assertEqual(result.returncode, 0, f"Script failed: {result.stderr}")
 
-            # Check that output file was created
-            output_file = test_file.parent / "complex_document-fixed.md"
-            self.assertTrue(output_file.exists(), "Output file was not created")
+        # Check that output file was created
+        output_file = test_file.parent / "complex_document-fixed.md"
+        self.assertTrue(output_file.exists(), "Output file was not created")
 
-            # Read and check the output
-            with open(output_file, "r") as f:
-                output_content = f.read()
-
-            # Check that math expressions are converted
-            self.assertIn(
-                "$\\int_{-\\infty}^{\\infty} e^{-x^2} dx = \\sqrt{\\pi}$",
-                output_content,
-            )
-            self.assertIn(
-                "$\\frac{\\partial f}{\\partial x} = \\lim_{h \\to 0} \\frac{f(x+h) - f(x)}{h}$",
-                output_content,
-            )
-            self.assertIn(
-                "$\\nabla \\cdot \\vec{E} = \\frac{\\rho}{\\epsilon_0}$",
-                output_content,
-            )
-
-            # Check that YAML front matter is preserved
-            self.assertIn("title: Complex Document", output_content)
-            self.assertIn("author: Test Author", output_content)
-
-            # Check that tables are preserved
-            self.assertIn("| Metric | Value | Unit |", output_content)
+        # Read and check the output
+        output_content = output_file.read_text()
 
-            # Clean up
-            if output_file.exists():
-                output_file.unlink()
+        # Check that math expressions are converted and that YAML front matter
+        # and tables are preserved
+        helpers.assert_all_in(self, COMPLEX_DOCUMENT_EXPECTED, output_content)
 
+    @helpers.requires_test_file("german_document.md")
     def test_german_document(self):
         """Test processing German document"""
-        test_file = self.test_data_dir / "german_document.md"
-        if test_file.exists():
-            result = self.run_md_to_md(str(test_file))
-
-            # Check that the script ran successfully
-            self.assertEqual(result.returncode, 0, f"Script failed: {result.stderr}")
-
-            # Check that output file was created
-            output_file = test_file.parent / "german_document-fixed.md"
-            self.assertTrue(output_file.exists(), "Output file was not created")
+        test_file = helpers.copy_test_file("german_document.md", self.temp_dir)
+        result = self.run_md_to_md(test_file)
 
-            # Read and check the output
-            with open(output_file, "r") as f:
-                output_content = f.read()
-
-            # Check that math expressions are converted
-            self.assertIn("$a^2 + b^2 = c^2$", output_content)
-            self.assertNotIn("\\$ a^2 + b^2 = c^2 \\$", output_content)
+        # Check that the script ran successfully
+        self.assertEqual(result.returncode, 0, f"Script failed: {result.stderr}")
 
-            # Check that German content is preserved
-            self.assertIn("Deutsches Dokument", output_content)
-            self.assertIn("Einführung", output_content)
+        # Check that output file was created
+        output_file = test_file.parent / "german_document-fixed.md"
+        self.assertTrue(output_file.exists(), "Output file was not created")
 
-            # Check that tables are preserved
-            self.assertIn("| Name | Alter | Stadt |", output_content)
+        # Read and check the output
+        output_content = output_file.read_text()
 
-            # Clean up
-            if output_file.exists():
-                output_file.unlink()
+        # Check that math expressions are converted and that German content
+        # and tables are preserved
+        helpers.assert_all_in(self, GERMAN_DOCUMENT_EXPECTED, output_content)
+        self.assertNotIn("\\$ a^2 + b^2 = c^2 \\$", output_content)
 
     def test_nonexistent_file(self):
         """Test handling of nonexistent file"""
@@ -236,8 +249,7 @@ Complex math: \\$ \\int_{-\\infty}^{\\infty} e^{-x^2} dx = \\sqrt{\\pi} \\$
             self.assertTrue(os.path.exists(output_file), "Output file was not created")
 
             # Read and check the output
-            with open(output_file, "r") as f:
-                output_content = f.read()
+            output_content = Path(output_file).read_text()
 
             # Output should be empty
             self.assertEqual(output_content, "")
@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 
+import shutil
 import subprocess
 import sys
+import tempfile
 import unittest
 from pathlib import Path
 
@@ -9,249 +11,137 @@ from pathlib import Path
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
-
-class TestPerplexityMdToPdf(unittest.TestCase):
-    """Test cases for perplexity-md-to-pdf script"""
+# Add the tests directory to the Python path, so that the test helpers can
+# be imported when the tests are run from the project root
+sys.path.insert(0, str(Path(__file__).parent))
+
+import helpers
+from test_config import get_test_file_path
+
+# Text expected in the help message
+HELP_EXPECTED = ("Usage:", "--language", "--font", "--landscape")
+
+
+class TestPerplexityMdToPdfConversions(unittest.TestCase):
+    """Test cases for PDF conversions with the perplexity-md-to-pdf script"""
+
+    # Conversions of test data files checked by the tests below, by name, as
+    # pairs of file name and command line options
+    CONVERSIONS = {
+        "basic": ("simple_document.md", ()),
+        "with_tables": ("document_with_tables.md", ()),
+        "complex": ("complex_document.md", ()),
+        "german": ("german_document.md", ("-l", "de")),
+        "custom_font": ("simple_document.md", ("-f", "Times")),
+        "no_fallback_fonts": ("simple_document.md", ("--no-fallback-fonts",)),
+        "single_column": ("simple_document.md", ("--single-column",)),
+        "landscape": ("simple_document.md", ("--landscape",)),
+        "landscape_with_tables": ("document_with_tables.md", ("--landscape",)),
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        """Run the conversions concurrently before the tests check them"""
+        # Without pandoc every conversion fails, so there is nothing to cache
+        if shutil.which("pandoc"):
+            helpers.prefetch_md_to_pdf(cls.CONVERSIONS.values())
 
     def setUp(self):
         """Set up test environment"""
-        self.script_path = project_root / "perplexity-md-to-pdf"
-        self.test_data_dir = Path(__file__).parent / "test_data"
-
-    def run_md_to_pdf(
-        self,
-        input_file,
-        language="en-US",
-        font="FreeSans",
-        no_fallback_fonts=False,
-        single_column=False,
-        landscape=False,
-    ):
-        """Helper method to run the md-to-pdf script"""
-        # Build the command string with all arguments
-        cmd_parts = [f"source '{self.script_path}' && perplexity-md-to-pdf"]
-
-        # Add options
-        if language != "en-US":
-            cmd_parts.extend(["-l", language])
-        if font != "FreeSans":
-            cmd_parts.extend(["-f", font])
-        if no_fallback_fonts:
-            cmd_parts.append("--no-fallback-fonts")
-        if single_column:
-            cmd_parts.append("--single-column")
-        if landscape:
-            cmd_parts.append("--landscape")
-
-        # Add input file
-        cmd_parts.append(f"'{input_file}'")
-
-        # Join all parts into a single command string
-        cmd_string = " ".join(cmd_parts)
-        cmd = ["bash", "-c", cmd_string]
-
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        return result
+        # Outputs are written next to the input, so tests work on copies of
+        # the test data in their own directory
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, ignore_errors=True)
 
-    def test_basic_conversion(self):
-        """Test basic markdown to PDF conversion"""
-        test_file = self.test_data_dir / "simple_document.md"
-        if test_file.exists():
-            result = self.run_md_to_pdf(str(test_file))
+    def check_conversion(self, name):
+        """Run one of the conversions on a copy of its test file and check it"""
+        filename, options = self.CONVERSIONS[name]
+        if filename not in helpers.TEST_DATA_FILES:
+            self.skipTest(f"Test file not found: {filename}")
+        test_file = helpers.copy_test_file(filename, self.temp_dir)
 
-            # Check that the script ran successfully
-            self.assertEqual(result.returncode, 0, f"Script failed: {result.stderr}")
+        # Identical conversions within a test run are served from a cache
+        result = helpers.run_md_to_pdf(test_file, options)
 
-            # Check that PDF file was created
-            pdf_file = test_file.parent / "simple_document.pdf"
-            self.assertTrue(pdf_file.exists(), "PDF file was not created")
+        # Check that the script ran successfully
+        self.assertEqual(result.returncode, 0, f"Script failed: {result.stderr}")
 
-            # Check that PDF file is not empty
-            self.assertGreater(pdf_file.stat().st_size, 0, "PDF file is empty")
+        # Check that a non-empty PDF file was created
+        pdf_file = helpers.get_output_path(test_file, ".pdf")
+        helpers.assert_nonempty_file(self, pdf_file, "PDF file")
 
-            # Clean up
-            if pdf_file.exists():
-                pdf_file.unlink()
+    def test_basic_conversion(self):
+        """Test basic markdown to PDF conversion"""
+        self.check_conversion("basic")
 
     def test_document_with_tables(self):
         """Test conversion of document with tables (should use single column)"""
-        test_file = self.test_data_dir / "document_with_tables.md"
-        if test_file.exists():
-            result = self.run_md_to_pdf(str(test_file))
-
-            # Check that the script ran successfully
-            self.assertEqual(result.returncode, 0, f"Script failed: {result.stderr}")
-
-            # Check that PDF file was created
-            pdf_file = test_file.parent / "document_with_tables.pdf"
-            self.assertTrue(pdf_file.exists(), "PDF file was not created")
-
-            # Check that PDF file is not empty
-            self.assertGreater(pdf_file.stat().st_size, 0, "PDF file is empty")
-
-            # Clean up
-            if pdf_file.exists():
-                pdf_file.unlink()
+        self.check_conversion("with_tables")
 
     def test_complex_document(self):
         """Test conversion of complex document with YAML front matter"""
-        test_file = self.test_data_dir / "complex_document.md"
-        if test_file.exists():
-            result = self.run_md_to_pdf(str(test_file))
-
-            # Check that the script ran successfully
-            self.assertEqual(result.returncode, 0, f"Script failed: {result.stderr}")
-
-            # Check that PDF file was created
-            pdf_file = test_file.parent / "complex_document.pdf"
-            self.assertTrue(pdf_file.exists(), "PDF file was not created")
-
-            # Check that PDF file is not empty
-            self.assertGreater(pdf_file.stat().st_size, 0, "PDF file is empty")
-
-            # Clean up
-            if pdf_file.exists():
-                pdf_file.unlink()
+        self.check_conversion("complex")
 
     def test_german_language_option(self):
         """Test German language option"""
-        test_file = self.test_data_dir / "german_document.md"
-        if test_file.exists():
-            result = self.run_md_to_pdf(str(test_file), language="de")
-
-            # Check that the script ran successfully
-            self.assertEqual(result.returncode, 0, f"Script failed: {result.stderr}")
-
-            # Check that PDF file was created
-            pdf_file = test_file.parent / "german_document.pdf"
-            self.assertTrue(pdf_file.exists(), "PDF file was not created")
-
-            # Check that PDF file is not empty
-            self.assertGreater(pdf_file.stat().st_size, 0, "PDF file is empty")
-
-            # Clean up
-            if pdf_file.exists():
-                pdf_file.unlink()
+        self.check_conversion("german")
 
     def test_custom_font_option(self):
         """Test custom font option"""
-        test_file = self.test_data_dir / "simple_document.md"
-        if test_file.exists():
-            result = self.run_md_to_pdf(str(test_file), font="Times")
-
-            # Check that the script ran successfully
-            self.assertEqual(result.returncode, 0, f"Script failed: {result.stderr}")
-
-            # Check that PDF file was created
-            pdf_file = test_file.parent / "simple_document.pdf"
-            self.assertTrue(pdf_file.exists(), "PDF file was not created")
-
-            # Check that PDF file is not empty
-            self.assertGreater(pdf_file.stat().st_size, 0, "PDF file is empty")
-
-            # Clean up
-            if pdf_file.exists():
-                pdf_file.unlink()
+        self.check_conversion("custom_font")
 
     def test_no_fallback_fonts_option(self):
         """Test --no-fallback-fonts option"""
-        test_file = self.test_data_dir / "simple_document.md"
-        if test_file.exists():
-            result = self.run_md_to_pdf(str(test_file), no_fallback_fonts=True)
-
-            # Check that the script ran successfully
-            self.assertEqual(result.returncode, 0, f"Script failed: {result.stderr}")
-
-            # Check that PDF file was created
-            pdf_file = test_file.parent / "simple_document.pdf"
-            self.assertTrue(pdf_file.exists(), "PDF file was not created")
-
-            # Check that PDF file is not empty
-            self.assertGreater(pdf_file.stat().st_size, 0, "PDF file is empty")
-
-            # Clean up
-            if pdf_file.exists():
-                pdf_file.unlink()
+        self.check_conversion("no_fallback_fonts")
 
     def test_single_column_option(self):
         """Test --single-column option"""
-        test_file = self.test_data_dir / "simple_document.md"
-        if test_file.exists():
-            result = self.run_md_to_pdf(str(test_file), single_column=True)
-
-            # Check that the script ran successfully
-            self.assertEqual(result.returncode, 0, f"Script failed: {result.stderr}")
-
-            # Check that PDF file was created
-            pdf_file = test_file.parent / "simple_document.pdf"
-            self.assertTrue(pdf_file.exists(), "PDF file was not created")
-
-            # Check that PDF file is not empty
-            self.assertGreater(pdf_file.stat().st_size, 0, "PDF file is empty")
-
-            # Clean up
-            if pdf_file.exists():
-                pdf_file.unlink()
+        self.check_conversion("single_column")
 
     def test_landscape_option(self):
         """Test --landscape option"""
-        test_file = self.test_data_dir / "simple_document.md"
-        if test_file.exists():
-            result = self.run_md_to_pdf(str(test_file), landscape=True)
-
-            # Check that the script ran successfully
-            self.assertEqual(result.returncode, 0, f"Script failed: {result.stderr}")
-
-            # Check that PDF file was created
-            pdf_file = test_file.parent / "simple_document.pdf"
-            self.assertTrue(pdf_file.exists(), "PDF file was not created")
-
-            # Check that PDF file is not empty
-            self.assertGreater(pdf_file.stat().st_size, 0, "PDF file is empty")
-
-            # Clean up
-            if pdf_file.exists():
-                pdf_file.unlink()
+        self.check_conversion("landscape")
 
     def test_landscape_option_with_tables(self):
         """Test --landscape option with document containing tables"""
-        test_file = self.test_data_dir / "document_with_tables.md"
-        if test_file.exists():
-            result = self.run_md_to_pdf(str(test_file), landscape=True)
+        self.check_conversion("landscape_with_tables")
 
-            # Check that the script ran successfully
-            self.assertEqual(result.returncode, 0, f"Script failed: {result.stderr}")
+    def test_tilde_expansion(self):
+        """Test tilde expansion in file paths"""
+        # Use the temporary directory as home directory, so that the test does
+        # not write to the real one
+        home_dir = Path(self.temp_dir)
+        temp_file = home_dir / "test_tilde.md"
+        temp_file.write_text("# Test Document\n\nSimple content for tilde test.")
+
+        # Test with tilde path
+        result = helpers.run_md_to_pdf(
+            "~/test_tilde.md", env=helpers.get_home_env(home_dir)
+        )
 
-            # Check that PDF file was created
-            pdf_file = test_file.parent / "document_with_tables.pdf"
-            self.assertTrue(pdf_file.exists(), "PDF file was not created")
+        # Check that the script ran successfully
+        self.assertEqual(result.returncode, 0, f"Script failed: {result.stderr}")
 
-            # Check that PDF file is not empty
-            self.assertGreater(pdf_file.stat().st_size, 0, "PDF file is empty")
+        # Check that a non-empty PDF file was created
+        pdf_file = home_dir / "test_tilde.pdf"
+        helpers.assert_nonempty_file(self, pdf_file, "PDF file")
 
-            # Clean up
-            if pdf_file.exists():
-                pdf_file.unlink()
+
+class TestPerplexityMdToPdf(unittest.TestCase):
+    """Test cases for the arguments and errors of perplexity-md-to-pdf"""
 
     def test_help_option(self):
         """Test help option"""
-        cmd = [
-            "bash",
-            "-c",
-            f"source '{self.script_path}' && perplexity-md-to-pdf --help",
-        ]
+        cmd = helpers.get_function_command("perplexity-md-to-pdf", ["--help"])
         result = subprocess.run(cmd, capture_output=True, text=True)
 
         # Check that help is displayed
         self.assertEqual(result.returncode, 0, f"Help failed: {result.stderr}")
-        self.assertIn("Usage:", result.stdout)
-        self.assertIn("--language", result.stdout)
-        self.assertIn("--font", result.stdout)
-        self.assertIn("--landscape", result.stdout)
+        helpers.assert_all_in(self, HELP_EXPECTED, result.stdout)
 
     def test_no_input_file(self):
         """Test error handling when no input file is provided"""
-        cmd = ["bash", "-c", f"source '{self.script_path}' && perplexity-md-to-pdf"]
+        cmd = helpers.get_function_command("perplexity-md-to-pdf", [])
         result = subprocess.run(cmd, capture_output=True, text=True)
 
         # Check that script fails with appropriate error
@@ -262,7 +152,7 @@ class TestPerplexityMdToPdf(unittest.TestCase):
 
     def test_nonexistent_file(self):
         """Test error handling for nonexistent file"""
-        result = self.run_md_to_pdf("/nonexistent/file.md")
+        result = helpers.run_md_to_pdf("/nonexistent/file.md")
 
         # Check that script fails with appropriate error
         self.assertNotEqual(
@@ -270,30 +160,24 @@ class TestPerplexityMdToPdf(unittest.TestCase):
         )
         self.assertIn("does not exist", result.stderr)
 
+    @helpers.requires_test_file("simple_document.md")
     def test_multiple_input_files(self):
         """Test error handling when multiple input files are provided"""
-        test_file = self.test_data_dir / "simple_document.md"
-        if test_file.exists():
-            cmd = [
-                "bash",
-                "-c",
-                f"source '{self.script_path}' && perplexity-md-to-pdf '{test_file}' '{test_file}'",
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True)
-
-            # Check that script fails with appropriate error
-            self.assertNotEqual(
-                result.returncode, 0, "Script should fail with multiple input files"
-            )
-            self.assertIn("Multiple input files specified", result.stderr)
+        test_file = get_test_file_path("simple_document.md")
+        cmd = helpers.get_function_command(
+            "perplexity-md-to-pdf", [test_file, test_file]
+        )
+        result = subprocess.run(cmd, capture_output=True, text=True)
+
+        # Check that script fails with appropriate error
+        self.assertNotEqual(
+            result.returncode, 0, "Script should fail with multiple input files"
+        )
+        self.assertIn("Multiple input files specified", result.stderr)
 
     def test_unknown_option(self):
         """Test error handling for unknown option"""
-        cmd = [
-            "bash",
-            "-c",
-            f"source '{self.script_path}' && perplexity-md-to-pdf --unknown-option",
-        ]
+        cmd = helpers.get_function_command("perplexity-md-to-pdf", ["--unknown-option"])
         result = subprocess.run(cmd, capture_output=True, text=True)
 
         # Check that script fails with appropriate error
@@ -302,34 +186,6 @@ class TestPerplexityMdToPdf(unittest.TestCase):
         )
         self.assertIn("Unknown option", result.stderr)
 
-    def test_tilde_expansion(self):
-        """Test tilde expansion in file paths"""
-        # Create a temporary file in home directory
-        home_dir = Path.home()
-        temp_file = home_dir / "test_tilde.md"
-
-        try:
-            with open(temp_file, "w") as f:
-                f.write("# Test Document\n\nSimple content for tilde test.")
-
-            # Test with tilde path
-            result = self.run_md_to_pdf("~/test_tilde.md")
-
-            # Check that the script ran successfully
-            self.assertEqual(result.returncode, 0, f"Script failed: {result.stderr}")
-
-            # Check that PDF file was created
-            pdf_file = home_dir / "test_tilde.pdf"
-            self.assertTrue(pdf_file.exists(), "PDF file was not created")
-
-            # Clean up
-            if pdf_file.exists():
-                pdf_file.unlink()
-
-        finally:
-            if temp_file.exists():
-                temp_file.unlink()
-
 
 if __name__ == "__main__":
     unittest.main()
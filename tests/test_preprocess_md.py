@@ -1,35 +1,103 @@
 #!/usr/bin/env python3
 
+import concurrent.futures
+import contextlib
+import importlib.util
+import io
+import os
+import re
 import subprocess
 import sys
+import tempfile
 import unittest
+from collections import Counter
 from pathlib import Path
+from unittest import mock
 
 # Add the project root to the Python path
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
+# Add the tests directory to the Python path, so that the test helpers can
+# be imported when the tests are run from the project root
+sys.path.insert(0, str(Path(__file__).parent))
+
+import helpers
+
+# Lines of the bibliography entry for https://example.com/source1
+SOURCE1_ENTRY_RE = re.compile(r"id: ref1|URL: https://example\.com/source1")
+
+# Front matter keys holding the font fallback configuration
+FALLBACK_FONT_KEYS = ("mainfontfallback", "sansfontfallback", "monofontfallback")
+
 
 class TestPerplexityPreprocessMd(unittest.TestCase):
     """Test cases for perplexity-preprocess-md.py"""
 
-    def setUp(self):
-        """Set up test environment"""
-        self.script_path = project_root / "perplexity-preprocess-md.py"
-        self.test_data_dir = Path(__file__).parent / "test_data"
+    SCRIPT_PATH = project_root / "perplexity-preprocess-md.py"
+    TEST_DATA_DIR = Path(__file__).parent / "test_data"
 
-    def run_preprocess(self, input_content, language="en-US", no_fallback_fonts=False):
-        """Helper method to run the preprocess script"""
-        cmd = [sys.executable, str(self.script_path), "-l", language]
+    @classmethod
+    def setUpClass(cls):
+        """Load the preprocess script and the test data once for all tests"""
+        spec = importlib.util.spec_from_file_location(
+            "perplexity_preprocess_md", cls.SCRIPT_PATH
+        )
+        cls.preprocess_module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(cls.preprocess_module)
+
+        # Read the test data files once for all tests; tests using a missing
+        # file are skipped
+        cls.test_inputs = {
+            path.name: path.read_bytes().decode("utf-8")
+            for path in cls.TEST_DATA_DIR.glob("*.md")
+        }
+
+    def run_preprocess(
+        self,
+        input_content,
+        language="en-US",
+        no_fallback_fonts=False,
+        env=None,
+        check_keys=None,
+        expected_returncode=0,
+    ):
+        """
+        Helper method to run the preprocess script's main function with the
+        given input, options and additional environment variables
+        """
+        argv = [str(self.SCRIPT_PATH), "-l", language]
         if no_fallback_fonts:
-            cmd.append("--no-fallback-fonts")
-
-        result = subprocess.run(
-            cmd, input=input_content, text=True, capture_output=True
+            argv.append("--no-fallback-fonts")
+        if check_keys:
+            argv.extend(["--check", ",".join(check_keys)])
+
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        returncode = 0
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(mock.patch.object(sys, "argv", argv))
+            stack.enter_context(
+                mock.patch.object(sys, "stdin", io.StringIO(input_content))
+            )
+            stack.enter_context(mock.patch.dict(os.environ, env or {}))
+            stack.enter_context(contextlib.redirect_stdout(stdout))
+            stack.enter_context(contextlib.redirect_stderr(stderr))
+            try:
+                self.preprocess_module.main()
+            except SystemExit as e:
+                returncode = e.code
+
+        self.assertEqual(
+            returncode, expected_returncode, f"Script failed: {stderr.getvalue()}"
         )
+        return stdout.getvalue()
 
-        self.assertEqual(result.returncode, 0, f"Script failed: {result.stderr}")
-        return result.stdout
+    def get_test_input(self, filename):
+        """Get the content of a test data file, skipping the test if it is missing"""
+        if filename not in self.test_inputs:
+            self.skipTest(f"Test file not found: {filename}")
+        return self.test_inputs[filename]
 
     def test_simple_footnote_conversion(self):
         """Test basic footnote to citation conversion"""
@@ -41,14 +109,20 @@ Some text with a footnote[^1].
 """
         output = self.run_preprocess(input_content)
 
-        # Check that footnote reference is converted to citation format
-        self.assertIn("[@ref1]", output)
+        # Check that footnote reference is converted to citation format and
+        # that a bibliography entry is added
+        helpers.assert_all_in(
+            self,
+            (
+                "[@ref1]",
+                "references:",
+                "id: ref1",
+                "URL: https://example.com/source1",
+            ),
+            output,
+        )
         # Check that footnote definition is removed
         self.assertNotIn("[^1]:", output)
-        # Check that bibliography entry is added
-        self.assertIn("references:", output)
-        self.assertIn("id: ref1", output)
-        self.assertIn("URL: https://example.com/source1", output)
 
     def test_duplicate_footnote_consolidation(self):
         """Test that duplicate footnotes are consolidated"""
@@ -64,8 +138,24 @@ Some text with footnotes[^1] and [^2].
         # Both references should point to the same citation
         self.assertIn("[@ref1]", output)
         # Should only have one bibliography entry
-        self.assertEqual(output.count("id: ref1"), 1)
-        self.assertEqual(output.count("URL: https://example.com/source1"), 1)
+        counts = Counter(SOURCE1_ENTRY_RE.findall(output))
+        self.assertEqual(counts["id: ref1"], 1)
+        self.assertEqual(counts["URL: https://example.com/source1"], 1)
+
+    def test_footnote_definition_at_start_of_document(self):
+        """Test that a footnote definition at the very start is removed"""
+        input_content = """[^1]: https://example.com/source1
+
+# Test Document
+
+Some text with a footnote[^1].
+"""
+        output = self.run_preprocess(input_content)
+
+        # Check that footnote definition is removed and reference is converted
+        self.assertNotIn("[^1]", output)
+        self.assertIn("Some text with a footnote[@ref1].", output)
+        self.assertIn("URL: https://example.com/source1", output)
 
     def test_math_expression_conversion(self):
         """Test math expression conversion"""
@@ -87,12 +177,22 @@ Math expression: \$ x = y + z \$
 """
         output = self.run_preprocess(input_content)
 
-        # Check that div is converted to LaTeX centering
-        self.assertIn("\\begin{center}", output)
-        self.assertIn("\\end{center}", output)
-        self.assertIn("Centered content", output)
-        # Check that horizontal line is added
-        self.assertIn("---", output)
+        # Check that div is converted to LaTeX centering followed by a
+        # horizontal line
+        helpers.assert_all_in(
+            self,
+            ("\\begin{center}", "\\end{center}", "Centered content", "---"),
+            output,
+        )
+
+    def test_end_center_inside_centered_div(self):
+        """Test that a \\end{center} inside a centered div is left as it is"""
+        input_content = '<div align="center">A\\end{center}B</div>\n\nText\n'
+        output = self.run_preprocess(input_content)
+
+        # The div and a stray \end{center} are rewritten in a single pass, so
+        # only the end of the div is followed by a horizontal line
+        self.assertIn("\\begin{center}\nA\\end{center}B\n\\end{center}\n\n---", output)
 
     def test_consecutive_citations_consolidation(self):
         """Test that consecutive citations are consolidated"""
@@ -125,11 +225,43 @@ Some text with a footnote[^1].
         output = self.run_preprocess(input_content)
 
         # Check that YAML is preserved and enhanced
-        self.assertIn("title: Test Document", output)
-        self.assertIn("author: Test Author", output)
-        self.assertIn("references:", output)
-        self.assertIn("csl:", output)
-        self.assertIn("lang: en-US", output)
+        helpers.assert_all_in(
+            self,
+            (
+                "title: Test Document",
+                "author: Test Author",
+                "references:",
+                "csl:",
+                "lang: en-US",
+            ),
+            output,
+        )
+
+    def test_settings_in_reference_urls(self):
+        """Test that settings named in reference URLs are still added"""
+        input_content = """---
+title: Test Document
+---
+
+# Test Document
+
+Some text with a footnote[^1].
+
+[^1]: https://example.com/page?lang:de&csl:custom&link-citations:false
+"""
+        output = self.run_preprocess(input_content)
+
+        # Only the original front matter is checked for existing settings, so
+        # the reference URL does not suppress them
+        helpers.assert_all_in(
+            self,
+            (
+                "\ncsl: https://raw.githubusercontent.com/citation-style-language/styles/master/nature.csl\n",
+                "\nlang: en-US\n",
+                "\nlink-citations: true\n",
+            ),
+            output,
+        )
 
     def test_german_language_detection(self):
         """Test German language handling"""
@@ -152,47 +284,203 @@ Some text with a footnote[^1].
 
 [^1]: https://example.com/source1
 """
-        output = self.run_preprocess(input_content, no_fallback_fonts=True)
+        # Check that font fallback configuration is not added; the script
+        # itself fails if it finds any of the keys
+        output = self.run_preprocess(
+            input_content, no_fallback_fonts=True, check_keys=FALLBACK_FONT_KEYS
+        )
+        self.assertEqual(output, "")
 
-        # Check that font fallback configuration is not added
-        self.assertNotIn("mainfontfallback:", output)
-        self.assertNotIn("sansfontfallback:", output)
-        self.assertNotIn("monofontfallback:", output)
+        # Without the option, the check finds the keys
+        self.run_preprocess(
+            input_content, check_keys=FALLBACK_FONT_KEYS, expected_returncode=1
+        )
+
+    def test_cache_dir(self):
+        """Test that results are cached in PERPLEXITY_CACHE_DIR"""
+        input_content = """# Test Document
+
+Some text with a footnote[^1].
+
+[^1]: https://example.com/source1
+"""
+        expected = self.run_preprocess(input_content)
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            env = {"PERPLEXITY_CACHE_DIR": cache_dir}
+
+            # First run fills the cache
+            self.assertEqual(self.run_preprocess(input_content, env=env), expected)
+            (cache_file,) = Path(cache_dir).iterdir()
+
+            # Second run is served from the cache, so it returns whatever the
+            # cache file holds
+            cache_file.write_text("cached", encoding="utf-8")
+            self.assertEqual(self.run_preprocess(input_content, env=env), "cached")
+
+            # Different options use a different cache entry
+            output = self.run_preprocess(input_content, language="de", env=env)
+            self.assertNotEqual(output, "cached")
+            self.assertIn("lang: de-DE", output)
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+    def test_server_mode(self):
+        """Test that --server answers every document frame in turn"""
+        documents = [
+            self.get_test_input("simple_document.md"),
+            "Text with math $x^2$ and a footnote[^1].\n\n[^1]: https://example.com/\n",
+        ]
+        frames = b"".join(
+            b"%d\n%b\n" % (len(content), content)
+            for content in (document.encode("utf-8") for document in documents)
+        )
+        result = subprocess.run(
+            [sys.executable, str(self.SCRIPT_PATH), "-l", "de", "--server"],
+            input=frames,
+            capture_output=True,
+        )
+        self.assertEqual(result.returncode, 0, f"Script failed: {result.stderr}")
+
+        expected = b"".join(
+            b"%d\n%b\n" % (len(content), content)
+            for content in (
+                self.run_preprocess(document, language="de").encode("utf-8")
+                for document in documents
+            )
+        )
+        self.assertEqual(result.stdout, expected)
+
+    def test_batch_mode(self):
+        """Test that --batch processes all documents in one run"""
+        if not self.test_inputs:
+            self.skipTest("No test files found")
+        separator = self.preprocess_module.BATCH_SEPARATOR
+        documents = list(self.test_inputs.values())
+        result = subprocess.run(
+            [sys.executable, str(self.SCRIPT_PATH), "-l", "de", "--batch"],
+            input=separator.join(documents),
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(result.returncode, 0, f"Script failed: {result.stderr}")
+
+        expected = [
+            self.run_preprocess(document, language="de") for document in documents
+        ]
+        self.assertEqual(result.stdout.split(separator), expected)
+
+    def test_parse_args(self):
+        """Test that the fast path and argparse parse arguments alike"""
+        parse_args = self.preprocess_module.parse_args
+        cases = (
+            ([], ("en-US", False, None, [])),
+            (["-l", "de", "--no-fallback-fonts"], ("de", True, None, [])),
+            (["--language=de"], ("de", False, None, [])),
+            (["--lang", "de"], ("de", False, None, [])),
+            (["--server"], ("en-US", False, "server", [])),
+            (["--check", "a,b"], ("en-US", False, "check", ["a", "b"])),
+            (["--check=a"], ("en-US", False, "check", ["a"])),
+        )
+        for argv, expected in cases:
+            with self.subTest(argv=argv):
+                self.assertEqual(parse_args(argv), expected)
+
+        for argv in (["-l"], ["--bogus"], ["--server", "--batch"]):
+            with self.subTest(argv=argv):
+                with contextlib.redirect_stderr(io.StringIO()):
+                    with self.assertRaises(SystemExit) as cm:
+                        parse_args(argv)
+                self.assertEqual(cm.exception.code, 2)
 
     def test_file_input(self):
         """Test processing a file from test_data directory"""
-        test_file = self.test_data_dir / "simple_document.md"
-        if test_file.exists():
-            with open(test_file, "r") as f:
-                input_content = f.read()
-
-            output = self.run_preprocess(input_content)
+        input_content = self.get_test_input("simple_document.md")
+        output = self.run_preprocess(input_content)
 
-            # Basic checks
-            self.assertIn("[@ref1]", output)
-            self.assertIn("[@ref2]", output)
-            self.assertIn("references:", output)
+        # Basic checks
+        self.assertIn("[@ref1]", output)
+        self.assertIn("[@ref2]", output)
+        self.assertIn("references:", output)
 
     def test_complex_document(self):
         """Test processing complex document with tables"""
-        test_file = self.test_data_dir / "complex_document.md"
-        if test_file.exists():
-            with open(test_file, "r") as f:
-                input_content = f.read()
-
-            output = self.run_preprocess(input_content)
-
-            # Check that all footnotes are converted and consecutive citations are consolidated
-            self.assertIn("[@ref1; @ref2]", output)
-            self.assertIn("[@ref3; @ref4; @ref5]", output)
-            # Check that math expressions are converted
-            self.assertIn(
-                "$\\int_{-\\infty}^{\\infty} e^{-x^2} dx = \\sqrt{\\pi}$", output
-            )
-            # Check that centered divs are converted
-            self.assertIn("\\begin{center}", output)
-            self.assertIn("\\end{center}", output)
+        input_content = self.get_test_input("complex_document.md")
+        output = self.run_preprocess(input_content)
+
+        helpers.assert_all_in(
+            self,
+            (
+                # All footnotes are converted and consecutive citations
+                # are consolidated
+                "[@ref1; @ref2]",
+                "[@ref3; @ref4; @ref5]",
+                # Math expressions are converted
+                "$\\int_{-\\infty}^{\\infty} e^{-x^2} dx = \\sqrt{\\pi}$",
+                # Centered divs are converted
+                "\\begin{center}",
+                "\\end{center}",
+            ),
+            output,
+        )
+
+
+def run_test_chunk(test_names):
+    """
+    Run some of the tests in a worker process.
+    Returns the number of tests run, the failures and errors as pairs of test
+    id and traceback, and the number of skipped tests.
+    """
+    suite = unittest.TestSuite(TestPerplexityPreprocessMd(name) for name in test_names)
+    result = unittest.TestResult()
+    suite.run(result)
+    return (
+        result.testsRun,
+        [(test.id(), traceback) for test, traceback in result.failures],
+        [(test.id(), traceback) for test, traceback in result.errors],
+        len(result.skipped),
+    )
+
+
+def run_tests_in_parallel(workers):
+    """Run the tests spread over a pool of worker processes"""
+    test_names = unittest.defaultTestLoader.getTestCaseNames(TestPerplexityPreprocessMd)
+    chunks = [test_names[i::workers] for i in range(workers)]
+
+    tests_run = skipped = 0
+    failures = []
+    errors = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk_result in executor.map(run_test_chunk, chunks):
+            tests_run += chunk_result[0]
+            failures.extend(chunk_result[1])
+            errors.extend(chunk_result[2])
+            skipped += chunk_result[3]
+
+    for kind, problems in (("ERROR", errors), ("FAIL", failures)):
+        for test_id, traceback in problems:
+            print("=" * 70, file=sys.stderr)
+            print(f"{kind}: {test_id}", file=sys.stderr)
+            print("-" * 70, file=sys.stderr)
+            print(traceback, file=sys.stderr)
+    print(f"Ran {tests_run} tests in {workers} worker processes", file=sys.stderr)
+
+    details = [
+        f"{name}={count}"
+        for name, count in (
+            ("failures", len(failures)),
+            ("errors", len(errors)),
+            ("skipped", skipped),
+        )
+        if count
+    ]
+    status = "FAILED" if failures or errors else "OK"
+    print(f"{status} ({', '.join(details)})" if details else status, file=sys.stderr)
+    return not (failures or errors)
 
 
 if __name__ == "__main__":
+    # TEST_WORKERS > 1 spreads the tests over that many processes
+    workers = int(os.environ.get("TEST_WORKERS", "1"))
+    if workers > 1:
+        sys.exit(0 if run_tests_in_parallel(workers) else 1)
     unittest.main()